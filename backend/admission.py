@@ -0,0 +1,249 @@
+import os
+import math
+import time
+import threading
+from collections import OrderedDict
+
+from starlette.responses import JSONResponse
+from jose import jwt, JWTError
+
+from auth import SECRET_KEY, ALGORITHM
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:
+    redis_asyncio = None
+
+# ────────────────────────────────────────────────
+# CONFIG
+# ────────────────────────────────────────────────
+# Lanes with their own token buckets and in-flight caps, so a flood of
+# chat traffic can never take the slots admin requests need (including
+# the login that gets the admin a token), and long batch streams can
+# never hold the ones add-event needs.
+LANES = {
+    "chat": {
+        "rate_per_minute": float(os.getenv("CHAT_RATE_PER_MINUTE", "30")),
+        "burst": int(os.getenv("CHAT_BURST", "10")),
+        "max_in_flight": int(os.getenv("CHAT_MAX_IN_FLIGHT", "8")),
+    },
+    "admin": {
+        "rate_per_minute": float(os.getenv("ADMIN_RATE_PER_MINUTE", "60")),
+        "burst": int(os.getenv("ADMIN_BURST", "10")),
+        "max_in_flight": int(os.getenv("ADMIN_MAX_IN_FLIGHT", "4")),
+    },
+    "auth": {
+        "rate_per_minute": float(os.getenv("AUTH_RATE_PER_MINUTE", "10")),
+        "burst": int(os.getenv("AUTH_BURST", "5")),
+        "max_in_flight": int(os.getenv("AUTH_MAX_IN_FLIGHT", "2")),
+    },
+    "batch": {
+        "rate_per_minute": float(os.getenv("BATCH_RATE_PER_MINUTE", "6")),
+        "burst": int(os.getenv("BATCH_BURST", "2")),
+        "max_in_flight": int(os.getenv("BATCH_MAX_IN_FLIGHT", "1")),
+    },
+}
+
+# In-flight caps are per worker (each worker has its own model and CPU
+# budget); buckets can be shared across workers through Redis.
+ADMISSION_REDIS_URL = os.getenv("ADMISSION_REDIS_URL")
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "0") == "1"
+MAX_TRACKED_CLIENTS = 10000
+
+
+def lane_for(path: str, authenticated: bool = False):
+    # Logins get a small lane of their own: a chat flood cannot lock the
+    # admin out, and password guessing cannot take admin slots. Past
+    # that the lane follows the token, not the path: requests with bogus
+    # tokens queue with public traffic
+    if not path.startswith(("/api/", "/auth/")):
+        return None
+    if path.startswith("/auth/"):
+        return "auth"
+    if authenticated and path.startswith("/api/chat/batch"):
+        return "batch"
+    if authenticated and path.startswith("/api/add-event"):
+        return "admin"
+    return "chat"
+
+
+def is_authenticated(scope) -> bool:
+    """Same check as main.verify_token, without the user lookup."""
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer":
+                return False
+            try:
+                return bool(jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub"))
+            except JWTError:
+                return False
+    return False
+
+
+def client_key(scope) -> str:
+    if TRUST_FORWARDED_FOR:
+        for name, value in scope.get("headers", []):
+            if name == b"x-forwarded-for":
+                return value.decode().split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+# ────────────────────────────────────────────────
+# TOKEN BUCKETS
+# ────────────────────────────────────────────────
+class MemoryBuckets:
+    """Per-process buckets, least recently seen clients evicted first."""
+
+    def __init__(self, max_clients: int = MAX_TRACKED_CLIENTS):
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """Takes one token; returns 0 if admitted, else seconds to wait."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+# Same refill logic as MemoryBuckets, run atomically inside Redis
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBuckets:
+    """Buckets shared by every worker through a Redis-compatible server."""
+
+    def __init__(self, url: str):
+        self._client = redis_asyncio.from_url(url)
+        self._take = self._client.register_script(_TAKE_SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        try:
+            wait = await self._take(
+                keys=[f"admission:{key}"], args=[rate, burst, time.time()]
+            )
+            return float(wait)
+        except Exception as e:
+            # Fail open: an unavailable limiter must not take the API down
+            print("❌ Admission Redis error:", e)
+            return 0.0
+
+
+def _make_buckets():
+    if ADMISSION_REDIS_URL:
+        if redis_asyncio is not None:
+            return RedisBuckets(ADMISSION_REDIS_URL)
+        print("⚠ ADMISSION_REDIS_URL set but redis is not installed; using in-memory buckets")
+    return MemoryBuckets()
+
+
+# ────────────────────────────────────────────────
+# IN-FLIGHT CAPS
+# ────────────────────────────────────────────────
+class InFlight:
+    def __init__(self, limits: dict):
+        self.limits = limits
+        self.counts = {lane: 0 for lane in limits}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, lane: str) -> bool:
+        with self._lock:
+            if self.counts[lane] >= self.limits[lane]:
+                return False
+            self.counts[lane] += 1
+            return True
+
+    def release(self, lane: str):
+        with self._lock:
+            self.counts[lane] -= 1
+
+
+# ────────────────────────────────────────────────
+# MIDDLEWARE
+# ────────────────────────────────────────────────
+class AdmissionMiddleware:
+    """
+    Rejects early instead of queueing: 503 once the lane already has
+    max_in_flight requests running, 429 once a client's bucket is empty.
+    The in-flight check comes first so a 503 does not spend the client's
+    rate budget. The slot is held until the response body has been sent,
+    so streamed responses count for their whole duration.
+    """
+
+    def __init__(self, app, lanes: dict = LANES, buckets=None):
+        self.app = app
+        self.lanes = lanes
+        self.buckets = buckets or _make_buckets()
+        self.in_flight = InFlight({
+            lane: cfg["max_in_flight"] for lane, cfg in lanes.items()
+        })
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        lane = lane_for(scope["path"], is_authenticated(scope))
+        if lane is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not self.in_flight.try_acquire(lane):
+            response = _reject(503, "Server busy, try again shortly", 1)
+            await response(scope, receive, send)
+            return
+
+        try:
+            cfg = self.lanes[lane]
+            wait = await self.buckets.take(
+                f"{lane}:{client_key(scope)}",
+                cfg["rate_per_minute"] / 60,
+                cfg["burst"],
+            )
+            if wait > 0:
+                response = _reject(429, "Too many requests", wait)
+                await response(scope, receive, send)
+                return
+
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight.release(lane)
+
+
+def _reject(status: int, detail: str, retry_after: float):
+    return JSONResponse(
+        {"detail": detail},
+        status_code=status,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
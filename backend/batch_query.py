@@ -0,0 +1,46 @@
+import sys
+import json
+import argparse
+
+import query_pipeline
+
+# ────────────────────────────────────────────────
+# BULK Q&A (EVALUATION / NEWSLETTER DIGEST)
+# ────────────────────────────────────────────────
+# Runs a file of questions (one per line) through
+# query_pipeline.answer_batch and streams JSONL to stdout:
+#
+#   python batch_query.py questions.txt > answers.jsonl
+#   cat questions.txt | python batch_query.py - --concurrency 4
+
+
+def read_questions(path: str):
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        return [line.strip() for line in stream if line.strip()]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer many questions in one batch")
+    parser.add_argument("questions", help="file with one question per line, or - for stdin")
+    parser.add_argument("--concurrency", type=int, default=query_pipeline.BATCH_LLM_CONCURRENCY,
+                        help="maximum LLM calls in flight")
+    parser.add_argument("--ordered", action="store_true",
+                        help="emit results in input order instead of as they complete")
+    args = parser.parse_args()
+
+    questions = read_questions(args.questions)
+    results = query_pipeline.answer_batch(questions, args.concurrency)
+    if args.ordered:
+        results = sorted(results, key=lambda r: r["index"])
+
+    for result in results:
+        sys.stdout.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,641 @@
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import argparse
+import platform
+import subprocess
+from io import StringIO
+from datetime import date, datetime
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# ────────────────────────────────────────────────
+# RETRIEVAL / END-TO-END BENCHMARK
+# ────────────────────────────────────────────────
+# Generates a synthetic `events` corpus plus a labelled query set that
+# covers every branch of query_pipeline.handle_user_query, runs it with a
+# stubbed LLM and writes p50/p95/p99 latency, throughput and recall@k as
+# JSON so runs can be compared.
+#
+#   python benchmark.py --rows 1000                              (sqlite + in-process search)
+#   python benchmark.py --rows 100000 --db-url postgresql://... --reset
+#   python benchmark.py --rows 1000 --out new.json --compare baseline.json
+#
+# The default embedder hashes tokens into fixed random vectors, so a 1M
+# row corpus can be generated in minutes; --embedder model uses BGE.
+
+DIM = 768
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Subject phrases avoid the words query_pipeline treats as domain / mode
+# filters, so each labelled query lands on the branch it is labelled with
+SUBJECTS = {
+    "AI": ["large language models", "image segmentation"],
+    "ML": ["gradient boosting", "recommender systems"],
+    "Robotics": ["drone swarms", "robot manipulators"],
+    "Web": ["frontend frameworks", "progressive apps"],
+    "Cloud": ["container orchestration", "serverless functions"],
+    "Blockchain": ["smart contracts", "zero knowledge proofs"],
+    "IoT": ["sensor networks", "edge devices"],
+    "Cyber": ["penetration testing", "malware analysis"],
+}
+FACETS = [
+    "healthcare", "finance", "education", "climate", "agriculture",
+    "gaming", "transport", "retail", "space", "music",
+]
+KINDS = ["Workshop", "Seminar", "Hackathon", "Talk", "Bootcamp"]
+MODES = ["Online", "Offline", "Hybrid"]
+YEARS = list(range(2019, 2026))
+SPEAKERS = ["Dr. Rao", "Prof. Iyer", "Ms. Mehta", "Mr. Khan", "Dr. Fernandes", "Prof. Sen"]
+VENUES = ["Main Auditorium", "Lab 3", "Seminar Hall", "Online"]
+
+# Some events get long write-ups so ingestion produces several chunks per
+# event and search has to collapse them
+LONG_FRACTION = 0.1
+LONG_FILLER = (
+    "Participants worked through guided exercises in small teams, "
+    "discussed open problems with the organisers and presented short demos. "
+)
+
+DOMAIN_NAMES = list(SUBJECTS)
+TOPICS = [
+    (domain, subject, facet)
+    for domain in DOMAIN_NAMES
+    for subject in SUBJECTS[domain]
+    for facet in FACETS
+]
+
+BRANCHES = [
+    "count", "report", "mode_list", "domain_list",
+    "filtered_vector", "semantic", "semantic_year", "follow_up",
+]
+VECTOR_BRANCHES = {"filtered_vector", "semantic", "semantic_year"}
+
+
+# ────────────────────────────────────────────────
+# STUBS
+# ────────────────────────────────────────────────
+class HashEmbedder:
+    """
+    Stands in for SentenceTransformer: a text's vector is the normalised
+    sum of a fixed pseudo-random vector per token, so texts sharing words
+    end up close together.
+    """
+
+    def __init__(self, dim: int = DIM):
+        self.dim = dim
+        self.vocab = {}
+        self.vectors = [np.zeros(dim, dtype=np.float32)]  # 0 = padding
+
+    def _token_id(self, token):
+        idx = self.vocab.get(token)
+        if idx is None:
+            rng = np.random.default_rng(zlib.crc32(token.encode()))
+            self.vectors.append(rng.standard_normal(self.dim).astype(np.float32))
+            idx = self.vocab[token] = len(self.vectors) - 1
+        return idx
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+
+        token_ids = [
+            [self._token_id(t) for t in TOKEN_RE.findall(text.lower())]
+            for text in texts
+        ]
+        width = max((len(ids) for ids in token_ids), default=0)
+        padded = np.zeros((len(texts), max(width, 1)), dtype=np.int64)
+        for row, ids in enumerate(token_ids):
+            padded[row, :len(ids)] = ids
+
+        table = np.stack(self.vectors)
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for col in range(padded.shape[1]):
+            out += table[padded[:, col]]
+        out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-9)
+
+        return out[0] if single else out
+
+
+class StubLLM:
+    """Echoes the prompt back, optionally after a fixed delay."""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000
+
+    def generate_content(self, prompt):
+        if self.latency:
+            time.sleep(self.latency)
+        return SimpleNamespace(text=prompt)
+
+
+# ────────────────────────────────────────────────
+# CORPUS
+# ────────────────────────────────────────────────
+def generate_metadata(rows: int, seed: int):
+    rng = np.random.default_rng(seed)
+    start = date(YEARS[0], 1, 1).toordinal()
+    end = date(YEARS[-1], 12, 31).toordinal()
+    return {
+        "topic": rng.integers(0, len(TOPICS), rows),
+        "kind": rng.integers(0, len(KINDS), rows),
+        "mode": rng.integers(0, len(MODES), rows),
+        "day": rng.integers(start, end + 1, rows),
+        "speaker": rng.integers(0, len(SPEAKERS), rows),
+        "venue": rng.integers(0, len(VENUES), rows),
+        "long": rng.random(rows) < LONG_FRACTION,
+    }
+
+
+def event_rows(meta, lo: int, hi: int):
+    """Rows lo..hi-1 in the same shape frontend.add_new_event stores."""
+    for i in range(lo, hi):
+        domain, subject, facet = TOPICS[meta["topic"][i]]
+        kind = KINDS[meta["kind"][i]]
+        mode = MODES[meta["mode"][i]]
+        name = f"{subject.title()} for {facet.title()} {kind}"
+        desc = f"A {kind.lower()} on {subject} applied to {facet}."
+        if meta["long"][i]:
+            desc += " " + LONG_FILLER * 25
+        perks = "Certificates"
+        yield {
+            "id": i + 1,
+            "name_of_event": name,
+            "event_domain": domain,
+            "date_of_event": date.fromordinal(int(meta["day"][i])).isoformat(),
+            "time_of_event": "10:00 AM",
+            "faculty_coordinators": "N/A",
+            "student_coordinators": "N/A",
+            "venue": VENUES[meta["venue"][i]],
+            "mode_of_event": mode,
+            "registration_fee": "0",
+            "speakers": SPEAKERS[meta["speaker"][i]],
+            "perks": perks,
+            "collaboration": "N/A",
+            "description_insights": desc,
+            "search_text": (
+                f"Event: {name}\n"
+                f"Domain: {domain}\n"
+                f"Description: {desc}\n"
+                f"Perks: {perks}\n"
+                f"Collaboration: N/A"
+            ),
+        }
+
+
+COLUMNS = [
+    "id", "name_of_event", "event_domain", "date_of_event", "time_of_event",
+    "faculty_coordinators", "student_coordinators", "venue", "mode_of_event",
+    "registration_fee", "speakers", "perks", "collaboration",
+    "description_insights", "search_text",
+]
+CHUNK_COLUMNS = ["id", "event_id", "chunk_no", "text", "embedding"]
+
+
+def _copy_field(value):
+    if value is None:
+        return "\\N"
+    return (
+        str(value).replace("\\", "\\\\").replace("\t", "\\t")
+        .replace("\n", "\\n").replace("\r", "\\r")
+    )
+
+
+def load_corpus(engine, embedder, meta, rows: int, is_postgres: bool, insert: bool,
+                chunk: int = 10000):
+    """
+    Chunks and embeds the corpus the way ingestion does, batch by batch.
+    Postgres gets the chunk vectors through COPY; for sqlite they are
+    returned for the in-process index instead of being round-tripped
+    through JSON text. Returns (chunk ids, event ids, matrix) for sqlite.
+    """
+    from chunking import make_chunks
+
+    chunk_ids, owners, matrices = [], [], []
+    next_chunk_id = 1
+    raw = engine.raw_connection() if insert else None
+
+    try:
+        for lo in range(0, rows, chunk):
+            hi = min(lo + chunk, rows)
+            batch = list(event_rows(meta, lo, hi))
+
+            chunk_rows = []
+            for r in batch:
+                for no, chunk_text in enumerate(make_chunks(r)):
+                    chunk_rows.append((next_chunk_id, r["id"], no, chunk_text))
+                    next_chunk_id += 1
+
+            vectors = np.asarray(
+                embedder.encode([c[3] for c in chunk_rows], batch_size=64),
+                dtype=np.float32,
+            )
+
+            if not is_postgres:
+                chunk_ids.extend(c[0] for c in chunk_rows)
+                owners.extend(c[1] for c in chunk_rows)
+                matrices.append(vectors)
+
+            if insert:
+                cur = raw.cursor()
+                if is_postgres:
+                    _copy(cur, "events", COLUMNS, (
+                        [r[c] for c in COLUMNS] for r in batch
+                    ))
+                    _copy(cur, "event_chunks", CHUNK_COLUMNS, (
+                        [*c, "[" + ",".join(f"{x:.6f}" for x in v) + "]"]
+                        for c, v in zip(chunk_rows, vectors)
+                    ))
+                else:
+                    cur.executemany(
+                        f"INSERT INTO events ({', '.join(COLUMNS)}) "
+                        f"VALUES ({', '.join('?' for _ in COLUMNS)})",
+                        [tuple(r[c] for c in COLUMNS) for r in batch],
+                    )
+                    cur.executemany(
+                        "INSERT INTO event_chunks (id, event_id, chunk_no, text) "
+                        "VALUES (?, ?, ?, ?)",
+                        chunk_rows,
+                    )
+                raw.commit()
+
+            print(f"[benchmark] corpus {hi}/{rows} ({next_chunk_id - 1} chunks)",
+                  file=sys.stderr)
+    finally:
+        if raw is not None:
+            raw.close()
+
+    if is_postgres:
+        return None
+    return chunk_ids, owners, np.concatenate(matrices)
+
+
+def _copy(cur, table, columns, records):
+    buf = StringIO()
+    for record in records:
+        buf.write("\t".join(_copy_field(v) for v in record) + "\n")
+    buf.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buf)
+
+
+def prepare_database(engine, is_postgres: bool, reset: bool):
+    from sqlalchemy import text
+    from database import Base
+    import models  # noqa: F401  (registers the tables)
+
+    if is_postgres:
+        with engine.connect() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+            conn.commit()
+
+    Base.metadata.create_all(bind=engine)
+
+    with engine.connect() as conn:
+        existing = conn.execute(text("SELECT COUNT(*) FROM events")).scalar()
+        if existing and not reset:
+            raise SystemExit(
+                f"events already holds {existing} rows; pass --reset to replace "
+                "them or --skip-load to reuse a corpus from an earlier run"
+            )
+        if existing and is_postgres:
+            conn.execute(text("TRUNCATE events RESTART IDENTITY CASCADE"))
+        elif existing:
+            conn.execute(text("DELETE FROM event_chunks"))
+            conn.execute(text("DELETE FROM events"))
+        conn.commit()
+
+
+def finish_database(engine, is_postgres: bool):
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS events_date_of_event ON events (date_of_event)"
+        ))
+        if is_postgres:
+            print("[benchmark] building HNSW index…", file=sys.stderr)
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS event_chunks_embedding_hnsw "
+                "ON event_chunks USING hnsw (embedding vector_l2_ops)"
+            ))
+            for table in ("events", "event_chunks"):
+                conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"(SELECT MAX(id) FROM {table}))"
+                ))
+                conn.execute(text(f"ANALYZE {table}"))
+        conn.commit()
+
+
+# ────────────────────────────────────────────────
+# LABELLED QUERIES
+# ────────────────────────────────────────────────
+def build_queries(meta, per_branch: int, seed: int):
+    """
+    Each query carries the branch it should take plus what is needed to
+    score it: the filters the pipeline will derive and, for vector
+    branches, the topic whose events count as relevant.
+    """
+    rng = np.random.default_rng(seed + 1)
+    queries = []
+
+    def pick(seq):
+        return seq[int(rng.integers(0, len(seq)))]
+
+    for _ in range(per_branch):
+        year = pick(YEARS)
+        mode = pick(MODES)
+        domain = pick(DOMAIN_NAMES)
+        topic = int(rng.integers(0, len(TOPICS)))
+        t_domain, subject, facet = TOPICS[topic]
+
+        queries += [
+            {"branch": "count", "question": f"How many events were held in {year}?",
+             "year": year},
+            {"branch": "report", "question": f"Give me a summary of events in {year}",
+             "year": year},
+            {"branch": "mode_list", "question": f"List {mode.lower()} events in {year}",
+             "year": year, "mode": mode.lower()},
+            {"branch": "domain_list",
+             "question": f"Which {domain} events were held in {year}?",
+             "year": year, "domain": domain.lower()},
+            {"branch": "filtered_vector",
+             "question": f"{mode} {t_domain} talks about {subject} for {facet} in {year}",
+             "year": year, "mode": mode.lower(), "domain": t_domain.lower(),
+             "topic": topic},
+            {"branch": "semantic",
+             "question": f"Tell me about the {subject} for {facet} sessions",
+             "topic": topic},
+            {"branch": "semantic_year",
+             "question": f"Tell me about the {subject} for {facet} sessions in {year}",
+             "year": year, "topic": topic},
+            {"branch": "follow_up", "question": "And who were the speakers?",
+             "setup": f"Tell me about the {subject} for {facet} sessions"},
+        ]
+
+    # Ground truth from the intended semantics rather than the SQL's:
+    # the event's own domain / mode label, calendar year on the date.
+    # A filter that also lets "Blockchain" through for "ai" shows up as
+    # lost recall instead of being copied into the expected set.
+    years = np.array([date.fromordinal(int(d)).year for d in meta["day"]])
+    domains = np.array([TOPICS[t][0].lower() for t in range(len(TOPICS))])[meta["topic"]]
+    modes = np.array([m.lower() for m in MODES])[meta["mode"]]
+
+    for q in queries:
+        mask = np.ones(len(years), dtype=bool)
+        if "year" in q:
+            mask &= years == q["year"]
+        if "mode" in q:
+            mask &= modes == q["mode"]
+        if "domain" in q:
+            mask &= domains == q["domain"]
+
+        if q["branch"] == "count":
+            q["expected_count"] = int(mask.sum())
+        if "topic" in q:
+            q["relevant"] = set((np.flatnonzero(mask & (meta["topic"] == q["topic"])) + 1).tolist())
+
+    return queries
+
+
+# ────────────────────────────────────────────────
+# RUNS
+# ────────────────────────────────────────────────
+def _latency_stats(samples_ms, wall_seconds=None):
+    if not samples_ms:
+        return {"n": 0}
+    arr = np.asarray(samples_ms)
+    stats = {
+        "n": len(arr),
+        "mean_ms": round(float(arr.mean()), 3),
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p95_ms": round(float(np.percentile(arr, 95)), 3),
+        "p99_ms": round(float(np.percentile(arr, 99)), 3),
+    }
+    if wall_seconds:
+        stats["throughput_qps"] = round(len(arr) / wall_seconds, 2)
+    return stats
+
+
+def run_retrieval(queries, k: int):
+    """search_events alone: latency and recall@k for the vector branches."""
+    import retriever as retriever_module
+    import query_pipeline
+
+    latencies, recalls = [], []
+    by_branch = {}
+
+    start = time.perf_counter()
+    for q in queries:
+        if q["branch"] not in VECTOR_BRANCHES or not q["relevant"]:
+            continue
+
+        filters = query_pipeline.year_filters(q.get("year"))
+        for key in ("mode", "domain"):
+            if key in q:
+                filters[key] = q[key]
+
+        t0 = time.perf_counter()
+        embedding = retriever_module.get_model().encode(retriever_module._clean(q["question"]))
+        rows = retriever_module.search_events(np.asarray(embedding).tolist(), filters, k)
+        elapsed = (time.perf_counter() - t0) * 1000
+
+        hits = {r.id for r in rows}
+        recall = len(hits & q["relevant"]) / min(k, len(q["relevant"]))
+
+        latencies.append(elapsed)
+        recalls.append(recall)
+        by_branch.setdefault(q["branch"], []).append(recall)
+    wall = time.perf_counter() - start
+
+    return {
+        **_latency_stats(latencies, wall),
+        f"recall_at_{k}": round(float(np.mean(recalls)), 4) if recalls else None,
+        "recall_by_branch": {
+            b: round(float(np.mean(r)), 4) for b, r in sorted(by_branch.items())
+        },
+    }
+
+
+def run_end_to_end(queries, concurrency: int):
+    """handle_user_query for every labelled query, `concurrency` at a time."""
+    import query_pipeline
+    import conversation
+
+    def one(q):
+        session = None
+        if q["branch"] == "follow_up":
+            session = conversation.Session("benchmark")
+            query_pipeline.handle_user_query(q["setup"], session)
+
+        t0 = time.perf_counter()
+        answer = query_pipeline.handle_user_query(q["question"], session)
+        elapsed = (time.perf_counter() - t0) * 1000
+
+        correct = None
+        if "expected_count" in q:
+            correct = f"Total events found: {q['expected_count']}" in answer
+        return q["branch"], elapsed, correct
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, queries))
+    wall = time.perf_counter() - start
+
+    by_branch = {}
+    for branch, elapsed, _ in results:
+        by_branch.setdefault(branch, []).append(elapsed)
+
+    checked = [c for _, _, c in results if c is not None]
+    return {
+        "overall": _latency_stats([e for _, e, _ in results], wall),
+        "by_branch": {b: _latency_stats(by_branch.get(b, [])) for b in BRANCHES},
+        "count_accuracy": round(sum(checked) / len(checked), 4) if checked else None,
+    }
+
+
+# ────────────────────────────────────────────────
+# COMPARISON
+# ────────────────────────────────────────────────
+def _flatten(obj, prefix=""):
+    out = {}
+    for key, value in obj.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            out.update(_flatten(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[path] = value
+    return out
+
+
+def compare(baseline: dict, current: dict, tolerance: float):
+    """Prints metric deltas; returns the list of regressions."""
+    old = _flatten({k: baseline[k] for k in ("retrieval", "end_to_end")})
+    new = _flatten({k: current[k] for k in ("retrieval", "end_to_end")})
+    regressions = []
+
+    print(f"{'metric':55} {'baseline':>12} {'current':>12} {'change':>9}")
+    for path in sorted(old.keys() & new.keys()):
+        a, b = old[path], new[path]
+        change = (b - a) / a if a else 0.0
+        flag = ""
+        if path.endswith(("p95_ms", "p99_ms")) and change > tolerance:
+            flag = "  ← slower"
+        elif "recall" in path and b < a - 0.01:
+            flag = "  ← recall dropped"
+        elif path.endswith("throughput_qps") and change < -tolerance:
+            flag = "  ← lower throughput"
+        if flag:
+            regressions.append(path)
+        print(f"{path:55} {a:>12} {b:>12} {change:>+8.1%}{flag}")
+
+    return regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return None
+
+
+# ────────────────────────────────────────────────
+# CLI
+# ────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval and handle_user_query")
+    parser.add_argument("--rows", type=int, default=1000, help="e.g. 1000, 100000, 1000000")
+    parser.add_argument("--db-url", help="Postgres+pgvector URL (default: local sqlite file)")
+    parser.add_argument("--reset", action="store_true", help="replace existing events rows")
+    parser.add_argument("--skip-load", action="store_true",
+                        help="reuse a corpus loaded by an earlier run with the same --rows/--seed")
+    parser.add_argument("--embedder", choices=["hash", "model"], default="hash")
+    parser.add_argument("--per-branch", type=int, default=25, help="labelled queries per branch")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="benchmark.json")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative p95/p99/throughput change that counts as a regression")
+    args = parser.parse_args()
+
+    # Must be in place before database / query_pipeline are imported
+    db_url = args.db_url or f"sqlite:///./benchmark_{args.rows}.db"
+    os.environ["NEON_DB_URL"] = db_url
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark-stub")
+
+    from database import engine
+    import retriever as retriever_module
+    import query_pipeline
+
+    is_postgres = retriever_module.IS_POSTGRES
+    if args.embedder == "hash":
+        retriever_module.model = HashEmbedder()
+    query_pipeline.llm = StubLLM(args.llm_latency_ms)
+
+    meta = generate_metadata(args.rows, args.seed)
+
+    # A Postgres corpus from an earlier run is searched in the database,
+    # so --skip-load has nothing to rebuild; sqlite still needs the
+    # in-process matrix
+    load_seconds = None
+    if not (args.skip_load and is_postgres):
+        t0 = time.perf_counter()
+        if not args.skip_load:
+            prepare_database(engine, is_postgres, args.reset)
+        in_process = load_corpus(
+            engine, retriever_module.get_model(), meta, args.rows,
+            is_postgres, insert=not args.skip_load,
+        )
+        if not args.skip_load:
+            finish_database(engine, is_postgres)
+        if in_process is not None:
+            chunk_ids, owners, matrix = in_process
+            retriever_module.memory_index.load(chunk_ids, owners, matrix, version=chunk_ids[-1])
+        load_seconds = round(time.perf_counter() - t0, 2)
+
+    queries = build_queries(meta, args.per_branch, args.seed)
+
+    result = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "rows": args.rows,
+            "backend": "postgres" if is_postgres else "in-process",
+            "embedder": args.embedder,
+            "k": args.k,
+            "queries": len(queries),
+            "concurrency": args.concurrency,
+            "llm_latency_ms": args.llm_latency_ms,
+            "seed": args.seed,
+            "load_seconds": load_seconds,
+        },
+        "retrieval": run_retrieval(queries, args.k),
+        "end_to_end": run_end_to_end(queries, args.concurrency),
+    }
+
+    with open(args.out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("rows") != args.rows:
+            print("⚠ baseline was recorded with a different --rows", file=sys.stderr)
+        if compare(baseline, result, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
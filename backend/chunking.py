@@ -0,0 +1,55 @@
+import os
+
+# ────────────────────────────────────────────────
+# CHUNKING
+# ────────────────────────────────────────────────
+# BGE truncates at 512 tokens, so long descriptions are split into
+# overlapping word windows and every window gets its own vector. ~200
+# words plus the event header stays well under the limit.
+CHUNK_WORDS = int(os.getenv("CHUNK_WORDS", "200"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "40"))
+EMBED_BATCH_SIZE = 32
+
+
+def split_words(text: str, size: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP):
+    words = (text or "").split()
+    if not words:
+        return []
+
+    step = max(1, size - overlap)
+    windows = []
+    for start in range(0, len(words), step):
+        windows.append(" ".join(words[start:start + size]))
+        if start + size >= len(words):
+            break
+    return windows
+
+
+def make_chunks(form_data: dict):
+    """
+    Chunk texts for one event, in chunk_no order. The first chunk carries
+    the same fields as the old single search_text; later ones repeat the
+    event name so each window can be matched on its own.
+    """
+    name = form_data.get("name_of_event") or "Unknown"
+    domain = form_data.get("event_domain") or "General"
+
+    header = (
+        f"Event: {name}\n"
+        f"Domain: {domain}\n"
+        f"Perks: {form_data.get('perks') or 'N/A'}\n"
+        f"Collaboration: {form_data.get('collaboration') or 'N/A'}"
+    )
+    windows = split_words(form_data.get("description_insights"))
+
+    if not windows:
+        return [header]
+
+    chunks = [f"{header}\nDescription: {windows[0]}"]
+    chunks += [f"Event: {name}\nDescription: {w}" for w in windows[1:]]
+    return chunks
+
+
+def vector_literal(embedding) -> str:
+    """pgvector's text format; also how sqlite stores the column."""
+    return "[" + ",".join(f"{float(x):.6f}" for x in embedding) + "]"
@@ -0,0 +1,139 @@
+import os
+import re
+import time
+import uuid
+import threading
+from collections import OrderedDict, deque
+
+# ────────────────────────────────────────────────
+# CONFIG
+# ────────────────────────────────────────────────
+# Sessions live in process memory: with several workers a follow-up that
+# lands on another worker simply starts a fresh session.
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "1800"))
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "1000"))
+
+# Every field is capped, so a session never holds (or resends in the
+# prompt) more than ~13.5k characters however long the conversation
+RECENT_TURNS = 2            # turns kept close to verbatim
+MAX_QUESTION_CHARS = 500    # per recent turn
+MAX_REPLY_CHARS = 1500      # per recent turn (a report answer can be many KB)
+MAX_SUMMARY_CHARS = 1500    # rolling summary of everything older
+MAX_ANSWER_CHARS = 200      # per turn, once folded into the summary
+MAX_CONTEXT_CHARS = 8000    # retrieved event rows kept for follow-ups
+MAX_SESSION_ID_LENGTH = 64
+
+FOLLOW_UP_PREFIXES = ("and ", "also ", "what about", "how about", "what else")
+# Pronouns only: "that" / "this" / "there" turn up in ordinary new
+# questions ("how many events were there in 2023?")
+REFERENCE_WORDS = {
+    "it", "its", "they", "them", "their", "those", "these",
+    "he", "she", "his", "her",
+}
+
+
+# ────────────────────────────────────────────────
+# SESSION
+# ────────────────────────────────────────────────
+class Session:
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.summary = ""
+        self.recent = deque()
+        self.context = None
+        self.last_seen = time.time()
+
+    def remember(self, question: str, answer: str, context: str | None):
+        self.recent.append((_clip(question, MAX_QUESTION_CHARS), _clip(answer, MAX_REPLY_CHARS)))
+        while len(self.recent) > RECENT_TURNS:
+            self._fold(*self.recent.popleft())
+
+        # A turn without rows clears the cache rather than leaving the
+        # previous turn's rows to answer the next follow-up
+        self.context = context[:MAX_CONTEXT_CHARS] if context else None
+
+    def _fold(self, question: str, answer: str):
+        # First sentence of the answer is usually enough to resolve
+        # "they" / "that event" later on
+        short = re.split(r"(?<=[.!?])\s", answer.strip(), maxsplit=1)[0]
+        line = f"Q: {question.strip()} → A: {short[:MAX_ANSWER_CHARS]}"
+
+        lines = (self.summary.splitlines() if self.summary else []) + [line]
+        while lines and len("\n".join(lines)) > MAX_SUMMARY_CHARS:
+            lines.pop(0)
+        self.summary = "\n".join(lines)
+
+    def history(self) -> str:
+        parts = []
+        if self.summary:
+            parts.append(f"Earlier (summarised):\n{self.summary}")
+        for q, a in self.recent:
+            parts.append(f"User: {q}\nAssistant: {a}")
+        return "\n\n".join(parts)
+
+
+def _clip(text: str, limit: int) -> str:
+    text = text.strip()
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def refers_back(question: str) -> bool:
+    """Phrased as a continuation ("and ...", "what about ...", pronouns)."""
+    q = question.lower().strip()
+    if q.startswith(FOLLOW_UP_PREFIXES):
+        return True
+
+    tokens = set(re.sub(r"[^\w\s]", " ", q).split())
+    return bool(tokens & REFERENCE_WORDS)
+
+
+def is_follow_up(question: str, session: Session | None) -> bool:
+    """
+    A follow-up is only answerable from the cached rows when there are
+    cached rows and the question leans on the previous turn.
+    """
+    if session is None or not session.context:
+        return False
+    return refers_back(question)
+
+
+# ────────────────────────────────────────────────
+# STORE (LRU + TTL)
+# ────────────────────────────────────────────────
+class SessionStore:
+    def __init__(self, ttl: int = SESSION_TTL_SECONDS, max_sessions: int = MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str | None) -> Session:
+        now = time.time()
+        if session_id and len(session_id) > MAX_SESSION_ID_LENGTH:
+            session_id = None
+
+        with self._lock:
+            self._evict_expired(now)
+
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = Session(session_id or uuid.uuid4().hex)
+                self._sessions[session.id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session.id)
+
+            session.last_seen = now
+            return session
+
+    def _evict_expired(self, now: float):
+        # Oldest entries sit at the front, so stop at the first live one
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_seen <= self.ttl:
+                break
+            self._sessions.popitem(last=False)
+
+
+sessions = SessionStore()
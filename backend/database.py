@@ -1,8 +1,9 @@
 # backend/database.py
 import os
+import re
 from dotenv import load_dotenv
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 load_dotenv()
@@ -22,6 +23,17 @@ engine = create_engine(
     connect_args=connect_args,
 )
 
+# sqlite has no REGEXP function of its own; the metadata filters use it
+# as the stand-in for Postgres' ~*
+if DATABASE_URL.startswith("sqlite"):
+    @event.listens_for(engine, "connect")
+    def _register_regexp(dbapi_connection, _):
+        dbapi_connection.create_function(
+            "REGEXP", 2,
+            lambda pattern, value: value is not None
+            and re.search(pattern, value, re.IGNORECASE) is not None,
+        )
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # 🔴 THIS is what was missing / broken
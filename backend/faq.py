@@ -0,0 +1,320 @@
+import os
+import re
+import time
+import json
+import argparse
+import threading
+from collections import Counter
+
+import numpy as np
+from sqlalchemy import text, inspect
+
+import retriever as retriever_module
+import conversation
+from database import engine
+from chunking import vector_literal, EMBED_BATCH_SIZE
+
+# ────────────────────────────────────────────────
+# CONFIG
+# ────────────────────────────────────────────────
+# Answers for the most common question shapes are precomputed offline
+# (python faq.py) and served with one comparison against a small matrix.
+# Similar phrasing is not enough: "events in 2023" and "events in 2024"
+# embed almost identically, so an answer is only served to questions
+# whose query plan (branch, year, mode, domain) matches its own.
+FAQ_SIMILARITY = float(os.getenv("FAQ_SIMILARITY", "0.92"))
+# Seconds between data_version checks; also how long another worker may
+# keep serving an answer after events change (one primary-key read)
+FAQ_VERSION_TTL = int(os.getenv("FAQ_VERSION_TTL", "5"))
+QUERY_LOG = os.getenv("QUERY_LOG", "1") == "1"  # serve.py --report turns it off
+CLUSTER_SIMILARITY = 0.90
+LOG_WINDOW = 20000          # most recent logged queries mined per run
+
+
+def normalise(question: str) -> str:
+    return re.sub(r"\s+", " ", question.lower()).strip(" ?!.")
+
+
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-9)
+
+
+def embed_questions(questions):
+    # Same text the vector search embeds, so a request can reuse its
+    # search embedding for the lookup instead of encoding twice
+    return _unit(retriever_module.get_model().encode(
+        [retriever_module._clean(q) for q in questions], batch_size=EMBED_BATCH_SIZE
+    ))
+
+
+# ────────────────────────────────────────────────
+# QUERY LOG
+# ────────────────────────────────────────────────
+def log_query(question: str):
+    # Follow-ups only make sense next to the turn before them; cached on
+    # their own they would be answered without it
+    if not QUERY_LOG or conversation.refers_back(question):
+        return
+    try:
+        with engine.begin() as conn:
+            conn.execute(
+                text("INSERT INTO query_log (query) VALUES (:q)"),
+                {"q": question[:2000]},
+            )
+    except Exception as e:
+        print("❌ Query log error:", e)
+
+
+# ────────────────────────────────────────────────
+# DATA VERSION
+# ────────────────────────────────────────────────
+# A counter bumped by triggers on every insert, update or delete on
+# events, so an edited date or venue invalidates answers as well as a
+# new row does. Installed once by install_schema.
+_VERSION_TRIGGERS = {
+    "postgresql": [
+        """
+        CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+        BEGIN
+            UPDATE data_version SET version = version + 1 WHERE id = 1;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE TRIGGER events_data_version
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON events
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()
+        """,
+    ],
+    "sqlite": [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS events_data_version_{op.lower()}
+        AFTER {op} ON events
+        BEGIN
+            UPDATE data_version SET version = version + 1 WHERE id = 1;
+        END
+        """
+        for op in ("INSERT", "UPDATE", "DELETE")
+    ],
+}
+
+
+def install_schema(conn):
+    """
+    Idempotent, and only takes DDL locks when something is missing, so
+    every worker can call it on start.
+    """
+    is_postgres = conn.dialect.name == "postgresql"
+    if is_postgres:
+        # Workers starting together queue here instead of racing the DDL
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('faq_install_schema'))"))
+
+    conn.execute(text(
+        "INSERT INTO data_version (id, version) VALUES (1, 0) "
+        "ON CONFLICT (id) DO NOTHING"
+    ))
+
+    # create_all does not add columns to a faq_answers table that
+    # predates them
+    columns = {c["name"] for c in inspect(conn).get_columns("faq_answers")}
+    if "context" not in columns:
+        conn.execute(text("ALTER TABLE faq_answers ADD COLUMN context TEXT"))
+
+    if is_postgres:
+        installed = conn.execute(text(
+            "SELECT 1 FROM pg_trigger "
+            "WHERE tgname = 'events_data_version' AND tgrelid = 'events'::regclass"
+        )).first()
+        if installed:
+            return
+    for statement in _VERSION_TRIGGERS.get(conn.dialect.name, []):
+        conn.execute(text(statement))
+
+
+def data_version(conn) -> str:
+    """An answer built from another version is never served."""
+    version = conn.execute(
+        text("SELECT version FROM data_version WHERE id = 1")
+    ).scalar()
+    return str(version or 0)
+
+
+# ────────────────────────────────────────────────
+# LOOKUP
+# ────────────────────────────────────────────────
+class FaqCache:
+    def __init__(self):
+        # (unit matrix, answers, contexts, plan keys) swapped as one tuple
+        self._data = (np.empty((0, 0), dtype=np.float32), [], [], [])
+        self.version = None
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Forces a version check on the next lookup (e.g. after add-event)."""
+        self.checked_at = 0.0
+
+    def _refresh(self):
+        import query_pipeline
+
+        if time.time() - self.checked_at < FAQ_VERSION_TTL:
+            return
+
+        with self._lock:
+            if time.time() - self.checked_at < FAQ_VERSION_TTL:
+                return
+            try:
+                with engine.connect() as conn:
+                    version = data_version(conn)
+                    if version != self.version:
+                        rows = conn.execute(
+                            text("""
+                                SELECT question, answer, context, embedding
+                                FROM faq_answers
+                                WHERE data_version = :v
+                            """),
+                            {"v": version},
+                        ).fetchall()
+                        vectors = [
+                            json.loads(r[3]) if isinstance(r[3], str) else r[3]
+                            for r in rows
+                        ]
+                        matrix = _unit(np.asarray(vectors, dtype=np.float32)) \
+                            if rows else np.empty((0, 0), dtype=np.float32)
+                        keys = [
+                            query_pipeline.plan_key(query_pipeline.plan_query(r[0]))
+                            for r in rows
+                        ]
+                        self._data = (
+                            matrix, [r[1] for r in rows], [r[2] for r in rows], keys
+                        )
+                        self.version = version
+            except Exception as e:
+                print("❌ FAQ cache error:", e)
+                self._data = (np.empty((0, 0), dtype=np.float32), [], [], [])
+                # Reload on the next check even if events did not change
+                self.version = None
+            self.checked_at = time.time()
+
+    def lookup(self, question: str, plan=None, embedding=None):
+        """
+        (answer, context) precomputed for `question`, or None. Pass the
+        search embedding (retriever.embed_query) when there is one; the
+        question is only encoded here when an answer with its plan exists.
+        """
+        import query_pipeline
+
+        self._refresh()
+        matrix, answers, contexts, keys = self._data
+        if not answers:
+            return None
+
+        key = query_pipeline.plan_key(plan or query_pipeline.plan_query(question))
+        same_plan = np.array([k == key for k in keys])
+        if not same_plan.any():
+            return None
+
+        q = _unit(embedding) if embedding is not None else embed_questions([question])[0]
+        sims = np.where(same_plan, matrix @ q, -1.0)
+        best = int(np.argmax(sims))
+        if sims[best] < FAQ_SIMILARITY:
+            return None
+        return answers[best], contexts[best]
+
+
+cache = FaqCache()
+
+
+# ────────────────────────────────────────────────
+# OFFLINE WARM-UP JOB
+# ────────────────────────────────────────────────
+def cluster_questions(questions, counts, keys, threshold: float = CLUSTER_SIMILARITY):
+    """
+    Greedy leader clustering: questions are visited most frequent first
+    and join the closest cluster with the same plan key, if close enough,
+    so every cluster is represented by its most asked phrasing.
+    """
+    vectors = embed_questions(questions)
+    order = sorted(range(len(questions)), key=lambda i: -counts[i])
+
+    leaders, clusters = [], []
+    for i in order:
+        candidates = [c for c, leader in enumerate(leaders) if keys[leader] == keys[i]]
+        if candidates:
+            sims = vectors[[leaders[c] for c in candidates]] @ vectors[i]
+            best = int(np.argmax(sims))
+            if sims[best] >= threshold:
+                clusters[candidates[best]]["size"] += counts[i]
+                continue
+        leaders.append(i)
+        clusters.append({"question": questions[i], "embedding": vectors[i], "size": counts[i]})
+
+    return sorted(clusters, key=lambda c: -c["size"])
+
+
+def warm(top: int = 30, min_size: int = 3):
+    import query_pipeline
+
+    with engine.connect() as conn:
+        logged = conn.execute(
+            text("SELECT query FROM query_log ORDER BY id DESC LIMIT :n"),
+            {"n": LOG_WINDOW},
+        ).fetchall()
+        version = data_version(conn)
+
+    # Follow-up phrasings logged before log_query skipped them
+    counter = Counter(
+        normalise(r[0]) for r in logged
+        if r[0].strip() and not conversation.refers_back(r[0])
+    )
+    if not counter:
+        print("[faq] No logged queries yet")
+        return 0
+
+    questions = list(counter)
+    keys = [query_pipeline.plan_key(query_pipeline.plan_query(q)) for q in questions]
+    clusters = [
+        c for c in cluster_questions(questions, [counter[q] for q in questions], keys)
+        if c["size"] >= min_size
+    ][:top]
+
+    rows = []
+    for c in clusters:
+        answer, context = query_pipeline.answer_fresh(c["question"])
+        rows.append({
+            "question": c["question"],
+            "answer": answer,
+            "context": context,
+            "embedding": vector_literal(c["embedding"]),
+            "cluster_size": c["size"],
+            "data_version": version,
+        })
+        print(f"[faq] {c['size']:>5} × {c['question']}")
+
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM faq_answers"))
+        if rows:
+            conn.execute(
+                text("""
+                    INSERT INTO faq_answers
+                        (question, answer, context, embedding, cluster_size, data_version)
+                    VALUES
+                        (:question, :answer, :context, :embedding, :cluster_size, :data_version)
+                """),
+                rows,
+            )
+
+    return len(rows)
+
+
+if __name__ == "__main__":
+    # Run periodically (e.g. nightly cron):  python faq.py --top 30
+    parser = argparse.ArgumentParser(description="Precompute answers for frequent questions")
+    parser.add_argument("--top", type=int, default=30, help="number of clusters to answer")
+    parser.add_argument("--min-size", type=int, default=3, help="smallest cluster worth caching")
+    args = parser.parse_args()
+
+    print(f"[faq] Stored {warm(args.top, args.min_size)} answers")
@@ -5,6 +5,8 @@ import psycopg2
 from pgvector.psycopg2 import register_vector
 from sentence_transformers import SentenceTransformer
 
+from chunking import make_chunks, EMBED_BATCH_SIZE
+
 # --- Config ---
 _MODEL = None
 _MODEL_LOCK = threading.Lock()
@@ -28,6 +30,19 @@ def _load_model():
             _MODEL = SentenceTransformer(MODEL_NAME, trust_remote_code=True)
     return _MODEL
 
+def _insert_chunks(cur, event_id, chunks, vectors):
+    cur.executemany(
+        """
+        INSERT INTO event_chunks (event_id, chunk_no, text, embedding)
+        VALUES (%s, %s, %s, %s)
+        """,
+        [
+            (event_id, no, chunk, vector)
+            for no, (chunk, vector) in enumerate(zip(chunks, vectors))
+        ],
+    )
+
+
 def add_new_event(form_data):
     conn = _get_db_connection()
     if not conn:
@@ -48,8 +63,12 @@ def add_new_event(form_data):
             f"Collaboration: {collab}"
         )
 
-        print(f"[frontend] Embedding: {name}")
-        embedding_vector = model.encode(search_text).tolist()
+        # One batched encode over every chunk; chunk 0 doubles as the
+        # event-level vector
+        chunks = make_chunks(form_data)
+        print(f"[frontend] Embedding: {name} ({len(chunks)} chunks)")
+        chunk_vectors = model.encode(chunks, batch_size=EMBED_BATCH_SIZE)
+        embedding_vector = chunk_vectors[0].tolist()
 
         with conn.cursor() as cur:
             register_vector(cur)
@@ -77,6 +96,7 @@ def add_new_event(form_data):
                     %s, %s, %s, %s, %s,
                     %s, %s, %s, %s, %s
                 )
+                RETURNING id
             """
 
             params = (
@@ -98,6 +118,9 @@ def add_new_event(form_data):
             )
 
             cur.execute(sql, params)
+            event_id = cur.fetchone()[0]
+
+            _insert_chunks(cur, event_id, chunks, chunk_vectors)
 
         conn.commit()
         return {"status": "success", "message": "Event saved successfully."}
@@ -111,3 +134,4 @@ def add_new_event(form_data):
     finally:
         if conn:
             conn.close()
+
@@ -1,16 +1,19 @@
+import json
 import hashlib
-from typing import Optional
+from typing import List, Optional
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from jose import jwt, JWTError
 from dotenv import load_dotenv
 
 from database import Base, engine, SessionLocal
 from models import User
 from auth import router as auth_router
+from admission import AdmissionMiddleware
 from sqlalchemy import text
 
 # ────────────────────────────────────────────────
@@ -20,6 +23,9 @@ load_dotenv()
 
 # Your existing logic
 import query_pipeline
+import retriever as retriever_module
+import conversation
+import faq
 import frontend  # python module, not nextjs
 
 # ────────────────────────────────────────────────
@@ -33,6 +39,10 @@ ALGORITHM = "HS256"
 # ────────────────────────────────────────────────
 app = FastAPI()
 
+# Rate limiting / load shedding (added first so CORS headers still wrap
+# the 429 / 503 responses it returns)
+app.add_middleware(AdmissionMiddleware)
+
 # CORS for Next.js
 app.add_middleware(
     CORSMiddleware,
@@ -88,8 +98,17 @@ def create_default_user():
 # ────────────────────────────────────────────────
 # DATA MODELS
 # ────────────────────────────────────────────────
+MAX_QUERY_CHARS = 2000
+
 class ChatRequest(BaseModel):
-    query: str
+    query: str = Field(..., max_length=MAX_QUERY_CHARS)
+    session_id: Optional[str] = None
+
+class BatchChatRequest(BaseModel):
+    questions: List[str]
+    concurrency: Optional[int] = None
+
+MAX_BATCH_QUESTIONS = 1000
 
 class EventData(BaseModel):
     name_of_event: str
@@ -114,12 +133,14 @@ def health_check():
     return {"status": "Club Knowledge Agent is active"}
 
 @app.post("/api/chat")
-def chat_endpoint(request: ChatRequest):
+def chat_endpoint(request: ChatRequest, background_tasks: BackgroundTasks):
     try:
         print("➡️ Incoming query:", request.query)
-        response = query_pipeline.handle_user_query(request.query)
+        background_tasks.add_task(faq.log_query, request.query)  # mined by faq.py
+        session = conversation.sessions.get(request.session_id)
+        response = query_pipeline.handle_user_query(request.query, session)
         print("✅ Agent response generated")
-        return {"answer": response}
+        return {"answer": response, "session_id": session.id}
 
     except Exception as e:
         import traceback
@@ -127,6 +148,30 @@ def chat_endpoint(request: ChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/chat/batch")
+def batch_chat_endpoint(
+    request: BatchChatRequest,
+    _: dict = Depends(verify_token),
+):
+    if len(request.questions) > MAX_BATCH_QUESTIONS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {MAX_BATCH_QUESTIONS} questions per batch",
+        )
+
+    concurrency = min(
+        request.concurrency or query_pipeline.BATCH_LLM_CONCURRENCY,
+        query_pipeline.BATCH_LLM_CONCURRENCY,
+    )
+    results = query_pipeline.answer_batch(request.questions, concurrency)
+
+    # One JSON object per line, in completion order
+    return StreamingResponse(
+        (json.dumps(r, default=str) + "\n" for r in results),
+        media_type="application/x-ndjson",
+    )
+
+
 @app.post("/api/add-event")
 def add_event_endpoint(
     event: EventData,
@@ -134,6 +179,7 @@ def add_event_endpoint(
 ):
     try:
         result = frontend.add_new_event(event.dict())
+        faq.cache.invalidate()
         return result
     except Exception as e:
         print("ADD EVENT ERROR:", e)  # keep this
@@ -151,7 +197,36 @@ if "sqlite" not in str(engine.url):
         conn.commit()
 
 Base.metadata.create_all(bind=engine)
+
+# data_version triggers and late faq_answers columns (no-op once present)
+with engine.begin() as conn:
+    faq.install_schema(conn)
+
+# ANN index over the chunk vectors plus a b-tree for the date filters they
+# are combined with (scans are tuned in retriever._tune_scan)
+if "sqlite" not in str(engine.url):
+    with engine.connect() as conn:
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS event_chunks_embedding_hnsw "
+            "ON event_chunks USING hnsw (embedding vector_l2_ops)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS events_date_of_event "
+            "ON events (date_of_event)"
+        ))
+        conn.commit()
+
 create_default_user()
 
+# Events stored before event_chunks existed have no chunk rows and are
+# invisible to vector search until `python retriever.py` chunks them
+with engine.connect() as conn:
+    unchunked = retriever_module.count_unchunked(conn)
+if unchunked:
+    print(f"⚠ {unchunked} events have no chunk vectors; run `python retriever.py`")
+
 # Run with:
 # uvicorn main:app --reload
+#
+# Production (pre-forked workers sharing the model):
+# python serve.py --workers 4
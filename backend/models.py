@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Date, Text
+from sqlalchemy import Column, Integer, String, Date, DateTime, Text, ForeignKey, UniqueConstraint
+from sqlalchemy.sql import func
 from pgvector.sqlalchemy import Vector
 from database import Base
 
@@ -27,4 +28,39 @@ class Event(Base):
     collaboration = Column(String)
     description_insights = Column(Text)
     search_text = Column(Text)
-    embedding = Column(Vector(768)) # BGE-base-en-v1.5 dim is 768
\ No newline at end of file
+    embedding = Column(Vector(768)) # BGE-base-en-v1.5 dim is 768
+
+class EventChunk(Base):
+    __tablename__ = "event_chunks"
+    __table_args__ = (UniqueConstraint("event_id", "chunk_no"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    event_id = Column(Integer, ForeignKey("events.id", ondelete="CASCADE"), nullable=False, index=True)
+    chunk_no = Column(Integer, nullable=False)
+    text = Column(Text, nullable=False)
+    embedding = Column(Vector(768))
+
+class QueryLog(Base):
+    __tablename__ = "query_log"
+
+    id = Column(Integer, primary_key=True, index=True)
+    query = Column(Text, nullable=False)
+    created_at = Column(DateTime, server_default=func.now(), index=True)
+
+class DataVersion(Base):
+    __tablename__ = "data_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)  # bumped by triggers on events
+
+class FaqAnswer(Base):
+    __tablename__ = "faq_answers"
+
+    id = Column(Integer, primary_key=True, index=True)
+    question = Column(Text, nullable=False)
+    answer = Column(Text, nullable=False)
+    context = Column(Text)  # rows the answer was built from, for follow-ups
+    embedding = Column(Vector(768))
+    cluster_size = Column(Integer)
+    data_version = Column(String, nullable=False, index=True)  # events the answer was built from
+    created_at = Column(DateTime, server_default=func.now())
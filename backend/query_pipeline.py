@@ -1,9 +1,12 @@
 import os
 import re
-from datetime import datetime
+from datetime import datetime, date
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import google.generativeai as genai
 
 import retriever as retriever_module
+import conversation
+import faq
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -20,6 +23,23 @@ llm = genai.GenerativeModel("gemini-2.5-flash-preview-09-2025")
 
 CURRENT_YEAR = datetime.now().year
 
+MODES = ["online", "offline", "hybrid"]
+DOMAINS = ["ai", "ml", "robotics", "web", "cloud", "blockchain", "iot", "cyber"]
+
+NO_EVENTS = "No events found."
+NO_INFORMATION = "I do not have enough information to answer that."
+
+# Phrasing that says nothing about the topic of an event
+GENERIC_WORDS = {
+    "event", "events", "workshop", "workshops", "talk", "talks", "session",
+    "sessions", "seminar", "seminars", "list", "show", "all", "which", "what",
+    "when", "where", "who", "were", "was", "are", "is", "did", "do", "does",
+    "any", "there", "held", "conducted", "organised", "organized", "happened",
+    "happen", "took", "place", "tell", "me", "about", "the", "a", "an", "of",
+    "in", "on", "for", "during", "year", "domain", "mode", "our", "club",
+    "give", "related", "to", "and", "or", "we", "have", "has", "had",
+}
+
 # ────────────────────────────────────────────────
 # HELPERS
 # ────────────────────────────────────────────────
@@ -28,16 +48,42 @@ def extract_year(text):
     return int(m.group()) if m else None
 
 
-def gemini_answer(question, context):
+def year_filters(year):
+    """Year as a date range, so the b-tree on date_of_event can be used."""
+    if not year:
+        return {}
+    return {"date_from": date(year, 1, 1), "date_to": date(year + 1, 1, 1)}
+
+
+def mentions(term, text):
+    """Whole word (or its plural): "webinars" is not "web", "aim" not "ai"."""
+    return re.search(rf"\b{term}s?\b", text) is not None
+
+
+def topic_terms(text, ignore=()):
+    """Words left once filter words and generic phrasing are removed."""
+    tokens = re.findall(r"[a-z0-9]+", text)
+    return [
+        t for t in tokens
+        if t not in GENERIC_WORDS and t not in ignore and not t.isdigit()
+    ]
+
+
+def gemini_answer(question, context, history=""):
     """
     Gemini ADDS language, NOT facts.
     """
+    conversation_block = f"""
+Conversation so far (use it only to resolve what the question refers to):
+{history}
+""" if history else ""
+
     prompt = f"""
 You are a university knowledge assistant.
 
 You must answer the question ONLY using the information below.
 If information is missing, say so clearly.
-
+{conversation_block}
 Question:
 {question}
 
@@ -53,7 +99,85 @@ Answer clearly, professionally, and naturally.
 # ────────────────────────────────────────────────
 # MAIN AGENT
 # ────────────────────────────────────────────────
-def handle_user_query(question: str) -> str:
+def handle_user_query(question: str, session=None) -> str:
+    history = session.history() if session else ""
+    plan = plan_query(question)
+
+    # Follow-ups ("and who were the speakers?") are answered from the
+    # rows retrieved for the previous turn instead of a fresh retrieval
+    if conversation.is_follow_up(question, session) and not stands_alone(plan):
+        context = session.context
+        answer = gemini_answer(question, context, history)
+    else:
+        # One encode serves both the FAQ check and the vector search
+        embedding = retriever_module.embed_query(question) if plan[0] == "vector" else None
+
+        # Frequent question shapes have answers precomputed by faq.py;
+        # their rows come along so follow-ups still have something to use
+        hit = faq.cache.lookup(question, plan, embedding)
+        if hit is not None:
+            answer, context = hit
+        else:
+            answer, context = answer_fresh(question, history, plan, embedding)
+
+    if session is not None:
+        session.remember(question, answer, context)
+
+    return answer
+
+
+def answer_fresh(question: str, history: str = "", plan=None, embedding=None):
+    """Returns (answer, context) so the context can be reused by follow-ups."""
+    plan = plan or plan_query(question)
+
+    if plan[0] == "sql":
+        _, sql, params, formatter = plan
+        context = formatter(retriever_module.query_relational_db(sql, params))
+        return _finish(question, context, history, NO_EVENTS)
+
+    _, filters = plan
+    context = _vector_context(
+        retriever_module.query_vector_db(question, filters, embedding=embedding)
+    )
+    return _finish(question, context, history, NO_INFORMATION)
+
+
+def _finish(question, context, history, fallback):
+    """context None means nothing to answer from: reply without the LLM."""
+    if context is None:
+        return fallback, None
+    return gemini_answer(question, context, history), context
+
+
+def _vector_context(vector_results):
+    return "\n\n".join(vector_results) if vector_results else None
+
+
+def _format_count(rows):
+    return f"Total events found: {rows[0][0] if rows else 0}"
+
+
+def _format_report(rows):
+    if not rows:
+        return None
+    return "\n".join(
+        f"{r[0]} | {r[1]} | {r[2]} | {r[3]} | {r[4]}"
+        for r in rows
+    )
+
+
+def _format_listing(rows):
+    return "\n".join(
+        f"{r[0]} ({r[1]}) – {r[2]}"
+        for r in rows
+    )
+
+
+def plan_query(question: str):
+    """
+    Decides how a question is answered without touching the DB:
+    ("sql", sql, params, formatter) or ("vector", filters).
+    """
     q = question.lower()
     year = extract_year(q)
 
@@ -61,17 +185,11 @@ def handle_user_query(question: str) -> str:
     # EVENTS COUNT
     # =====================================================
     if "how many" in q and "event" in q:
+        where, params = retriever_module.filter_clause(year_filters(year))
         sql = "SELECT COUNT(*) FROM events"
-        if year:
-            sql += f" WHERE EXTRACT(YEAR FROM date_of_event) = {year}"
-
-        rows = retriever_module.query_relational_db(sql)
-        count = rows[0][0] if rows else 0
-
-        return gemini_answer(
-            question,
-            f"Total events found: {count}"
-        )
+        if where:
+            sql += f" WHERE {where}"
+        return "sql", sql, params, _format_count
 
     # =====================================================
     # FULL REPORT (FIXED: NO LIMIT)
@@ -81,65 +199,128 @@ def handle_user_query(question: str) -> str:
         SELECT name_of_event, event_domain, date_of_event, venue, speakers
         FROM events
         """
-        if year:
-            sql += f" WHERE EXTRACT(YEAR FROM date_of_event) = {year}"
+        where, params = retriever_module.filter_clause(year_filters(year))
+        if where:
+            sql += f" WHERE {where}"
         sql += " ORDER BY date_of_event"
-
-        rows = retriever_module.query_relational_db(sql)
-
-        if not rows:
-            return "No events found."
-
-        context = "\n".join(
-            f"{r[0]} | {r[1]} | {r[2]} | {r[3]} | {r[4]}"
-            for r in rows
-        )
-
-        return gemini_answer(question, context)
+        return "sql", sql, params, _format_report
 
     # =====================================================
-    # ONLINE / OFFLINE / HYBRID
+    # ONLINE / OFFLINE / HYBRID  and  DOMAIN / DEPARTMENT
     # =====================================================
-    for mode in ["online", "offline", "hybrid"]:
-        if mode in q:
-            rows = retriever_module.query_relational_db(
-                f"""
-                SELECT name_of_event, date_of_event
-                FROM events
-                WHERE mode_of_event ILIKE '%{mode}%'
-                ORDER BY date_of_event
-                """
-            )
+    # A bare "online events in 2024" is a listing; anything with a topic
+    # left over ("AI talks about LLMs in 2024") becomes a vector search
+    # restricted to the matching rows.
+    filters = year_filters(year)
 
-            context = "\n".join(f"{r[0]} ({r[1]})" for r in rows)
-            return gemini_answer(question, context)
+    mode = next((m for m in MODES if mentions(m, q)), None)
+    domain = next((d for d in DOMAINS if mentions(d, q)), None)
+    if mode:
+        filters["mode"] = mode
+    if domain:
+        filters["domain"] = domain
 
-    # =====================================================
-    # DOMAIN / DEPARTMENT QUERIES
-    # =====================================================
-    domains = ["ai", "ml", "robotics", "web", "cloud", "blockchain", "iot", "cyber"]
-    for d in domains:
-        if d in q:
-            rows = retriever_module.query_relational_db(
-                f"""
-                SELECT name_of_event, event_domain, date_of_event
-                FROM events
-                WHERE event_domain ILIKE '%{d}%'
-                """
-            )
-            context = "\n".join(
-                f"{r[0]} ({r[1]}) – {r[2]}"
-                for r in rows
-            )
-            return gemini_answer(question, context)
+    matched = {t for t in (mode, domain) if t}
+    if matched and not topic_terms(q, ignore=matched | {f"{t}s" for t in matched}):
+        where, params = retriever_module.filter_clause(filters)
+        sql = f"""
+            SELECT name_of_event, event_domain, date_of_event
+            FROM events
+            WHERE {where}
+            ORDER BY date_of_event
+        """
+        return "sql", sql, params, _format_listing
 
     # =====================================================
     # RAG / SEMANTIC QUESTIONS
     # =====================================================
-    vector_results = retriever_module.query_vector_db(question)
+    return "vector", filters
+
+
+def plan_key(plan):
+    """
+    Hashable identity of a plan: two questions with equal keys run the
+    same SQL with the same params, or the same vector search filters.
+    """
+    params = plan[2] if plan[0] == "sql" else plan[1]
+    values = tuple(sorted((k, str(v)) for k, v in params.items()))
+    return (plan[0], plan[1], values) if plan[0] == "sql" else (plan[0], values)
+
+
+def stands_alone(plan) -> bool:
+    """
+    Counts, reports and questions naming their own year, mode or domain
+    need fresh rows, whatever pronouns they use.
+    """
+    return plan[0] == "sql" or bool(plan[1])
+
+
+# ────────────────────────────────────────────────
+# BATCH
+# ────────────────────────────────────────────────
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+
+def answer_batch(questions, concurrency: int = BATCH_LLM_CONCURRENCY):
+    """
+    Answers many independent questions, yielding
+    {"index", "question", "answer" | "error"} as each one completes.
+
+    Identical structured queries run once, all semantic questions are
+    encoded in one batch and searched with one statement, and at most
+    `concurrency` LLM calls are in flight. Sessions and the FAQ cache are
+    bypassed so evaluation runs see real answers. Blank questions get an
+    error without being planned.
+    """
+    blank = {i for i, q in enumerate(questions) if not q.strip()}
+    plans = [None if i in blank else plan_query(q) for i, q in enumerate(questions)]
+    contexts = {}
+
+    # Structured paths: one query per distinct (sql, params)
+    groups = {}
+    for i, plan in enumerate(plans):
+        if plan and plan[0] == "sql":
+            groups.setdefault(plan_key(plan), []).append(i)
+
+    for indexes in groups.values():
+        _, sql, params, _ = plans[indexes[0]]
+        rows = retriever_module.query_relational_db(sql, params)
+        for i in indexes:
+            contexts[i] = plans[i][3](rows)
+
+    # Semantic paths: one encode call, one search round trip
+    vector_indexes = [i for i, plan in enumerate(plans) if plan and plan[0] == "vector"]
+    if vector_indexes:
+        try:
+            results = retriever_module.query_vector_db_batch(
+                [questions[i] for i in vector_indexes],
+                [plans[i][1] for i in vector_indexes],
+            )
+            for i, vector_results in zip(vector_indexes, results):
+                contexts[i] = _vector_context(vector_results)
+        except Exception as e:
+            print("❌ Batch vector search error:", e)
+            for i in vector_indexes:
+                contexts[i] = e
 
-    if vector_results:
-        context = "\n\n".join(vector_results)
-        return gemini_answer(question, context)
+    def run(i):
+        try:
+            if i in blank:
+                raise ValueError("Empty question")
+            if isinstance(contexts[i], Exception):
+                raise contexts[i]
+            fallback = NO_INFORMATION if plans[i][0] == "vector" else NO_EVENTS
+            answer, _ = _finish(questions[i], contexts[i], "", fallback)
+            return {"index": i, "question": questions[i], "answer": answer}
+        except Exception as e:
+            return {"index": i, "question": questions[i], "error": str(e)}
 
-    return "I do not have enough information to answer that."
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    try:
+        futures = [pool.submit(run, i) for i in range(len(questions))]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # A client that disconnects closes the generator: drop the LLM
+        # calls that have not started instead of waiting for all of them
+        pool.shutdown(wait=False, cancel_futures=True)
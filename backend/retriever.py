@@ -1,28 +1,51 @@
 import os
+import re
+import json
+import threading
+from types import SimpleNamespace
 from dotenv import load_dotenv
-from sqlalchemy import text
+from sqlalchemy import text, bindparam
 from sentence_transformers import SentenceTransformer
 import numpy as np
 
 from database import engine
+from chunking import make_chunks, vector_literal, EMBED_BATCH_SIZE
 
 load_dotenv()
 
+# sqlite (local dev / benchmarks) has no pgvector: vector search then runs
+# in-process over a matrix loaded from events.embedding
+IS_POSTGRES = "sqlite" not in str(engine.url)
+
+# Case-insensitive regex match; sqlite gets REGEXP from database.py
+MATCH = "~*" if IS_POSTGRES else "REGEXP"
+WORD_BOUNDARY = r"\y" if IS_POSTGRES else r"\b"
+
 # ────────────────────────────────────────────────
 # EMBEDDING MODEL
 # ────────────────────────────────────────────────
-model = SentenceTransformer(
-    "BAAI/bge-base-en-v1.5",
-    trust_remote_code=True
-)
+# Loaded on first use, so tools that swap in another embedder (the
+# benchmark's hash embedder) never download or load BGE
+MODEL_NAME = "BAAI/bge-base-en-v1.5"
+model = None
+_MODEL_LOCK = threading.Lock()
+
+
+def get_model():
+    global model
+    if model is None:
+        with _MODEL_LOCK:
+            if model is None:
+                model = SentenceTransformer(MODEL_NAME, trust_remote_code=True)
+    return model
 
 # ────────────────────────────────────────────────
 # RELATIONAL QUERY
 # ────────────────────────────────────────────────
-def query_relational_db(sql: str):
+def query_relational_db(sql: str, params: dict | None = None):
     try:
         with engine.connect() as conn:
-            result = conn.execute(text(sql))
+            result = conn.execute(text(sql), params or {})
             rows = result.fetchall()
         return rows or []
     except Exception as e:
@@ -30,9 +53,74 @@ def query_relational_db(sql: str):
         return []
 
 
+# ────────────────────────────────────────────────
+# METADATA FILTERS
+# ────────────────────────────────────────────────
+# Supported keys (all optional):
+#   date_from / date_to  → date range, date_to exclusive
+#   domain               → word in event_domain ("ai" matches "AI/ML",
+#                          not "Blockchain"; "ml" not "HTML")
+#   mode                 → word in mode_of_event
+def word_pattern(term: str) -> str:
+    """Same whole-word (or plural) rule query_pipeline.mentions uses."""
+    return f"{WORD_BOUNDARY}{re.escape(term)}s?{WORD_BOUNDARY}"
+
+
+def filter_clause(filters: dict | None, alias: str = ""):
+    """Turns a filters dict into a WHERE fragment plus bound params."""
+    col = f"{alias}." if alias else ""
+    clauses, params = [], {}
+    filters = filters or {}
+
+    if filters.get("date_from"):
+        clauses.append(f"{col}date_of_event >= :date_from")
+        params["date_from"] = filters["date_from"]
+    if filters.get("date_to"):
+        clauses.append(f"{col}date_of_event < :date_to")
+        params["date_to"] = filters["date_to"]
+    if filters.get("domain"):
+        clauses.append(f"{col}event_domain {MATCH} :domain")
+        params["domain"] = word_pattern(filters["domain"])
+    if filters.get("mode"):
+        clauses.append(f"{col}mode_of_event {MATCH} :mode")
+        params["mode"] = word_pattern(filters["mode"])
+
+    return " AND ".join(clauses), params
+
+
 # ────────────────────────────────────────────────
 # VECTOR SEARCH
 # ────────────────────────────────────────────────
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "100"))
+_PGVECTOR_VERSION = None
+
+
+def _pgvector_version(conn):
+    global _PGVECTOR_VERSION
+    if _PGVECTOR_VERSION is None:
+        row = conn.execute(
+            text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        ).first()
+        _PGVECTOR_VERSION = tuple(
+            int(p) for p in row[0].split(".")[:2]
+        ) if row else (0, 0)
+    return _PGVECTOR_VERSION
+
+
+def _tune_scan(conn, candidates: int):
+    """
+    A plain HNSW scan returns at most ef_search rows and *then* applies
+    the WHERE clause, so a selective filter or a large candidate pool can
+    leave fewer rows than asked for. pgvector >= 0.8 can keep scanning
+    the index until enough rows pass; older versions only get a wider
+    candidate list (ef_search tops out at 1000).
+    """
+    if _pgvector_version(conn) >= (0, 8):
+        conn.execute(text("SET LOCAL hnsw.iterative_scan = relaxed_order"))
+    ef_search = min(max(HNSW_EF_SEARCH, candidates), 1000)
+    conn.execute(text(f"SET LOCAL hnsw.ef_search = {ef_search}"))
+
+
 def _clean(text_query: str):
     import re
     stopwords = {
@@ -44,56 +132,414 @@ def _clean(text_query: str):
     return " ".join(tokens) if tokens else text_query
 
 
-def query_vector_db(text_query: str):
-    query = _clean(text_query)
+# ────────────────────────────────────────────────
+# CHUNK SEARCH
+# ────────────────────────────────────────────────
+# Long descriptions are indexed as several chunk vectors (event_chunks).
+# A search pulls the nearest chunks, collapses them to distinct events
+# scored by their best chunk (max-sim), and keeps the matching chunks
+# so only those reach the prompt.
+CHUNK_CANDIDATES_PER_EVENT = 8
+MAX_CHUNK_CANDIDATES = 4000  # per query, however many chunks one event has
+MAX_CHUNKS_PER_EVENT = 2
+
+EVENT_COLUMNS = """
+    id,
+    name_of_event,
+    event_domain,
+    date_of_event,
+    time_of_event,
+    venue,
+    speakers
+"""
+
+
+def _collapse(hits, k: int):
+    """hits: (event_id, chunk_no, text, distance) sorted by distance."""
+    events = {}
+    for event_id, chunk_no, chunk_text, distance in hits:
+        entry = events.get(event_id)
+        if entry is None:
+            if len(events) == k:
+                continue
+            entry = events[event_id] = {"distance": distance, "chunks": []}
+        if len(entry["chunks"]) < MAX_CHUNKS_PER_EVENT:
+            entry["chunks"].append((chunk_no, chunk_text))
+    return events
+
+
+def _collapse_until_k(fetch, n_queries: int, k: int):
+    """
+    One long description can fill the whole candidate pool with its own
+    chunks, so queries that collapse to fewer than k events are asked
+    again with a pool four times larger, until they reach k events, run
+    out of chunks or hit MAX_CHUNK_CANDIDATES.
+
+    fetch(qids, candidates) -> {qid: [(event_id, chunk_no, text, distance)]}
+    sorted by distance.
+    """
+    collapsed = [{} for _ in range(n_queries)]
+    pending = list(range(n_queries))
+    candidates = k * CHUNK_CANDIDATES_PER_EVENT
+
+    while pending:
+        hits = fetch(pending, candidates)
+        short = []
+        for qid in pending:
+            found = hits.get(qid, [])
+            collapsed[qid] = _collapse(found, k)
+            if len(collapsed[qid]) < k and len(found) >= candidates:
+                short.append(qid)
+
+        if candidates >= MAX_CHUNK_CANDIDATES:
+            break
+        pending = short
+        candidates = min(candidates * 4, MAX_CHUNK_CANDIDATES)
+
+    return collapsed
+
+
+def _event_rows(conn, ids):
+    if not ids:
+        return {}
+    rows = conn.execute(
+        text(f"SELECT {EVENT_COLUMNS} FROM events WHERE id IN :ids")
+        .bindparams(bindparam("ids", expanding=True)),
+        {"ids": list(ids)},
+    ).fetchall()
+    return {r.id: r for r in rows}
+
+
+def _attach_events(collapsed, by_id):
+    """Event rows in score order, each with .distance and .chunks."""
+    return [
+        SimpleNamespace(
+            **by_id[event_id]._mapping,
+            distance=hit["distance"],
+            # Back in document order so overlapping windows read naturally
+            chunks=[t for _, t in sorted(hit["chunks"])],
+        )
+        for event_id, hit in collapsed.items()
+        if event_id in by_id
+    ]
+
+
+def _attach_all(conn, collapsed_per_query):
+    """One events lookup shared by every query's hits."""
+    ids = set().union(*collapsed_per_query) if collapsed_per_query else set()
+    by_id = _event_rows(conn, ids)
+    return [_attach_events(collapsed, by_id) for collapsed in collapsed_per_query]
+
+
+def search_events(embedding, filters: dict | None = None, k: int = 5):
+    """Nearest events to `embedding` among the rows matching `filters`."""
+    if not IS_POSTGRES:
+        return _search_in_memory([embedding], [filters], k)[0]
+
+    where, params = filter_clause(filters, alias="e")
+    join = "JOIN events e ON e.id = c.event_id" if where else ""
+
+    # relaxed_order may return hits slightly out of order, so the outer
+    # query re-sorts the materialized candidates by distance
+    sql = f"""
+        WITH hits AS MATERIALIZED (
+            SELECT
+                c.event_id,
+                c.chunk_no,
+                c.text,
+                c.embedding <-> (:vec)::vector AS distance
+            FROM event_chunks c
+            {join}
+            {"WHERE " + where if where else ""}
+            ORDER BY distance
+            LIMIT :candidates
+        )
+        SELECT * FROM hits ORDER BY distance
+    """
+
+    with engine.begin() as conn:
+        def fetch(qids, candidates):
+            _tune_scan(conn, candidates)
+            rows = conn.execute(
+                text(sql), {**params, "vec": embedding, "candidates": candidates}
+            ).fetchall()
+            return {0: [tuple(r) for r in rows]}
+
+        return _attach_all(conn, _collapse_until_k(fetch, 1, k))[0]
+
+
+def search_events_batch(embeddings, filters_list, k: int = 5):
+    """
+    search_events for many queries in one round trip: the query vectors
+    and their filters travel as a VALUES list and each row runs its own
+    ANN scan through a LATERAL join.
+    """
+    if not IS_POSTGRES:
+        return _search_in_memory(embeddings, filters_list, k)
+    if not len(embeddings):
+        return []
+
+    def statement(qids, candidates):
+        values, params = [], {"candidates": candidates}
+        for i in qids:
+            filters = filters_list[i] or {}
+            values.append(
+                f"({i}, CAST(:vec{i} AS vector), CAST(:from{i} AS date), "
+                f"CAST(:to{i} AS date), CAST(:domain{i} AS text), CAST(:mode{i} AS text))"
+            )
+            params[f"vec{i}"] = vector_literal(embeddings[i])
+            params[f"from{i}"] = filters.get("date_from")
+            params[f"to{i}"] = filters.get("date_to")
+            params[f"domain{i}"] = word_pattern(filters["domain"]) if filters.get("domain") else None
+            params[f"mode{i}"] = word_pattern(filters["mode"]) if filters.get("mode") else None
+
+        sql = f"""
+            SELECT q.qid, h.event_id, h.chunk_no, h.text, h.distance
+            FROM (VALUES {", ".join(values)})
+                AS q(qid, vec, date_from, date_to, domain, mode)
+            CROSS JOIN LATERAL (
+                SELECT
+                    c.event_id,
+                    c.chunk_no,
+                    c.text,
+                    c.embedding <-> q.vec AS distance
+                FROM event_chunks c
+                JOIN events e ON e.id = c.event_id
+                WHERE (q.date_from IS NULL OR e.date_of_event >= q.date_from)
+                  AND (q.date_to IS NULL OR e.date_of_event < q.date_to)
+                  AND (q.domain IS NULL OR e.event_domain ~* q.domain)
+                  AND (q.mode IS NULL OR e.mode_of_event ~* q.mode)
+                ORDER BY c.embedding <-> q.vec
+                LIMIT :candidates
+            ) h
+            ORDER BY q.qid, h.distance
+        """
+        return text(sql), params
+
+    with engine.begin() as conn:
+        def fetch(qids, candidates):
+            _tune_scan(conn, candidates)
+            hits = {}
+            for r in conn.execute(*statement(qids, candidates)):
+                hits.setdefault(r.qid, []).append(
+                    (r.event_id, r.chunk_no, r.text, r.distance)
+                )
+            return hits
+
+        return _attach_all(conn, _collapse_until_k(fetch, len(embeddings), k))
+
+
+# ────────────────────────────────────────────────
+# IN-PROCESS FALLBACK (NO PGVECTOR)
+# ────────────────────────────────────────────────
+class InMemoryIndex:
+    """
+    Exact L2 search over every chunk embedding. Reloaded whenever a newer
+    chunk id shows up; chunks are only ever appended, so MAX(id) is enough
+    to notice new rows without scanning the table.
+    """
+
+    QUERY_BLOCK = 64  # queries scored per matrix product
+
+    def __init__(self):
+        # (chunk ids, event ids, matrix, squared norms) swapped as one
+        # tuple so concurrent searches never mix two loads
+        self._data = (
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.int64),
+            np.empty((0, 0), dtype=np.float32),
+            np.empty(0, dtype=np.float32),
+        )
+        self.version = None
+        self._lock = threading.Lock()
+
+    def load(self, ids, event_ids, matrix, version=None):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        self._data = (
+            np.asarray(ids, dtype=np.int64),
+            np.asarray(event_ids, dtype=np.int64),
+            matrix,
+            np.einsum("ij,ij->i", matrix, matrix),
+        )
+        self.version = version
+
+    def refresh(self, conn):
+        version = conn.execute(text("SELECT MAX(id) FROM event_chunks")).scalar()
+        if version == self.version:
+            return
+
+        with self._lock:
+            if version == self.version:
+                return
+            rows = conn.execute(text(
+                "SELECT id, event_id, embedding FROM event_chunks "
+                "WHERE embedding IS NOT NULL"
+            )).fetchall()
+            vectors = [
+                json.loads(r[2]) if isinstance(r[2], str) else r[2]
+                for r in rows
+            ]
+            matrix = np.asarray(vectors, dtype=np.float32) \
+                if rows else np.empty((0, 0), dtype=np.float32)
+            self.load([r[0] for r in rows], [r[1] for r in rows], matrix, version)
+
+    def search(self, embedding, n: int, allowed_event_ids=None):
+        """Returns [(chunk_id, event_id, distance)] for the n nearest chunks."""
+        return self.search_many([embedding], n, [allowed_event_ids])[0]
 
+    def search_many(self, embeddings, n: int, allowed_per_query):
+        """search() for a batch of queries, scored block by block."""
+        ids, event_ids, matrix, sq_norms = self._data
+        if not len(ids):
+            return [[] for _ in embeddings]
+
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        results = []
+
+        for start in range(0, len(queries), self.QUERY_BLOCK):
+            block = queries[start:start + self.QUERY_BLOCK]
+            distances = (
+                sq_norms[None, :]
+                - 2 * (block @ matrix.T)
+                + np.einsum("ij,ij->i", block, block)[:, None]
+            )
+
+            for row, allowed in zip(distances, allowed_per_query[start:start + len(block)]):
+                if allowed is None:
+                    positions = np.arange(len(ids))
+                else:
+                    positions = np.flatnonzero(np.isin(event_ids, allowed))
+
+                if not len(positions):
+                    results.append([])
+                    continue
+
+                top_n = min(n, len(positions))
+                subset = row[positions]
+                top = np.argpartition(subset, top_n - 1)[:top_n]
+                top = top[np.argsort(subset[top])]
+                results.append([
+                    (
+                        int(ids[positions[i]]),
+                        int(event_ids[positions[i]]),
+                        float(np.sqrt(max(subset[i], 0.0))),
+                    )
+                    for i in top
+                ])
+
+        return results
+
+
+memory_index = InMemoryIndex()
+
+
+def _search_in_memory(embeddings, filters_list, k):
+    with engine.connect() as conn:
+        memory_index.refresh(conn)
+
+        # One id lookup per distinct filter set in the batch
+        allowed_by_filters = {}
+        allowed_per_query = []
+        for filters in filters_list:
+            where, params = filter_clause(filters)
+            if not where:
+                allowed_per_query.append(None)
+                continue
+            key = (where, tuple(sorted((name, str(v)) for name, v in params.items())))
+            if key not in allowed_by_filters:
+                allowed_by_filters[key] = [
+                    r[0] for r in conn.execute(
+                        text(f"SELECT id FROM events WHERE {where}"), params
+                    )
+                ]
+            allowed_per_query.append(allowed_by_filters[key])
+
+        def fetch(qids, candidates):
+            nearest = memory_index.search_many(
+                [embeddings[i] for i in qids],
+                candidates,
+                [allowed_per_query[i] for i in qids],
+            )
+
+            chunk_ids = {chunk_id for hits in nearest for chunk_id, _, _ in hits}
+            by_id = {}
+            if chunk_ids:
+                chunk_rows = conn.execute(
+                    text("SELECT id, chunk_no, text FROM event_chunks WHERE id IN :ids")
+                    .bindparams(bindparam("ids", expanding=True)),
+                    {"ids": list(chunk_ids)},
+                ).fetchall()
+                by_id = {r.id: r for r in chunk_rows}
+
+            return {
+                qid: [
+                    (event_id, by_id[chunk_id].chunk_no, by_id[chunk_id].text, distance)
+                    for chunk_id, event_id, distance in hits
+                    if chunk_id in by_id
+                ]
+                for qid, hits in zip(qids, nearest)
+            }
+
+        return _attach_all(conn, _collapse_until_k(fetch, len(embeddings), k))
+
+
+def format_results(rows):
+    if not rows:
+        return ["No matching events found"]
+
+    # Only the chunks that matched go into the prompt, not the whole
+    # (possibly 50k character) description
+    return [
+        f"📌 {r.name_of_event}\n"
+        f"• Domain: {r.event_domain}\n"
+        f"• Date: {r.date_of_event}\n"
+        f"• Time: {r.time_of_event}\n"
+        f"• Venue: {r.venue}\n"
+        f"• Speakers: {r.speakers}\n"
+        f"• Details:\n" + "\n…\n".join(r.chunks)
+        for r in rows
+    ]
+
+
+def embed_query(text_query: str):
+    """The vector search uses for a question (also what faq.py compares)."""
     try:
-        embedding = model.encode(query)
+        embedding = get_model().encode(_clean(text_query))
         if isinstance(embedding, np.ndarray):
             embedding = embedding.tolist()
+        return embedding
     except Exception as e:
         print("❌ Embedding error:", e)
-        return ["Embedding failed"]
-
-    try:
-        with engine.connect() as conn:
-            result = conn.execute(
-                text("""
-                    SELECT
-                        name_of_event,
-                        event_domain,
-                        date_of_event,
-                        time_of_event,
-                        venue,
-                        description_insights
-                    FROM events
-                    ORDER BY embedding <-> (:vec)::vector
-                    LIMIT 5
-                """),
-                {"vec": embedding},
-            )
-
+        return None
 
-            rows = result.fetchall()
 
-        if not rows:
-            return ["No matching events found"]
+def query_vector_db(text_query: str, filters: dict | None = None, k: int = 5, embedding=None):
+    # Callers that already embedded the question pass it in
+    if embedding is None:
+        embedding = embed_query(text_query)
+    if embedding is None:
+        return ["Embedding failed"]
 
-        return [
-            f"📌 {r[0]}\n"
-            f"• Domain: {r[1]}\n"
-            f"• Date: {r[2]}\n"
-            f"• Time: {r[3]}\n"
-            f"• Venue: {r[4]}\n"
-            f"• Details: {r[5]}"
-            for r in rows
-        ]
+    try:
+        return format_results(search_events(embedding, filters, k))
 
     except Exception as e:
         print("❌ Vector DB error:", e)
         return ["Vector search failed"]
 
 
+def query_vector_db_batch(text_queries, filters_list, k: int = 5):
+    """query_vector_db for many questions: one encode call, one search."""
+    embeddings = np.asarray(
+        get_model().encode([_clean(q) for q in text_queries], batch_size=EMBED_BATCH_SIZE),
+        dtype=np.float32,
+    )
+    return [
+        format_results(rows)
+        for rows in search_events_batch(embeddings, filters_list, k)
+    ]
+
+
 # ────────────────────────────────────────────────
 # INSERT NEW EVENT (THIS WAS MISSING 🚨)
 # ────────────────────────────────────────────────
@@ -106,12 +552,12 @@ def add_new_event(form_data: dict):
             f"{form_data.get('perks', '')}"
         )
 
-        embedding = model.encode(search_text)
-        if isinstance(embedding, np.ndarray):
-            embedding = embedding.tolist()
+        # Chunk vectors in one batch; chunk 0 doubles as the event vector
+        chunks = make_chunks(form_data)
+        vectors = get_model().encode(chunks, batch_size=EMBED_BATCH_SIZE)
 
         with engine.begin() as conn:  # ✅ auto-commit
-            conn.execute(
+            event_id = conn.execute(
                 text(
                     """
                     INSERT INTO events (
@@ -148,17 +594,91 @@ def add_new_event(form_data: dict):
                         :search_text,
                         :embedding
                     )
+                    RETURNING id
                     """
                 ),
                 {
                     **form_data,
                     "search_text": search_text,
-                    "embedding": embedding,
+                    "embedding": vector_literal(vectors[0]),
                 },
-            )
+            ).scalar()
+
+            _insert_chunks(conn, event_id, chunks, vectors)
 
         return {"status": "success"}
 
     except Exception as e:
         print("❌ Insert error:", e)
         return {"status": "error", "message": str(e)}
+
+
+def _insert_chunks(conn, event_id, chunks, vectors):
+    # ON CONFLICT makes two overlapping backfill runs harmless
+    conn.execute(
+        text(
+            """
+            INSERT INTO event_chunks (event_id, chunk_no, text, embedding)
+            VALUES (:event_id, :chunk_no, :text, :embedding)
+            ON CONFLICT (event_id, chunk_no) DO NOTHING
+            """
+        ),
+        [
+            {
+                "event_id": event_id,
+                "chunk_no": no,
+                "text": chunk,
+                "embedding": vector_literal(vector),
+            }
+            for no, (chunk, vector) in enumerate(zip(chunks, vectors))
+        ],
+    )
+
+
+# ────────────────────────────────────────────────
+# CHUNK BACKFILL
+# ────────────────────────────────────────────────
+# Events stored before event_chunks existed are invisible to vector
+# search until chunked. That is a one-shot job (python retriever.py):
+# at import it would run inference in the pre-fork master and again in
+# every worker.
+UNCHUNKED = """
+    FROM events e
+    WHERE NOT EXISTS (
+        SELECT 1 FROM event_chunks c WHERE c.event_id = e.id
+    )
+"""
+
+
+def count_unchunked(conn) -> int:
+    return conn.execute(text(f"SELECT COUNT(*) {UNCHUNKED}")).scalar()
+
+
+def backfill_chunks():
+    """Chunks and embeds every event that has no chunk rows yet."""
+    try:
+        with engine.connect() as conn:
+            events = conn.execute(text(f"""
+                SELECT id, name_of_event, event_domain, description_insights,
+                       perks, collaboration
+                {UNCHUNKED}
+            """)).mappings().all()
+
+        for event in events:
+            chunks = make_chunks(event)
+            vectors = get_model().encode(chunks, batch_size=EMBED_BATCH_SIZE)
+            with engine.begin() as conn:
+                _insert_chunks(conn, event["id"], chunks, vectors)
+
+        if events:
+            print(f"✅ Chunked {len(events)} events stored before chunking")
+        return len(events)
+
+    except Exception as e:
+        print("❌ Chunk backfill error:", e)
+        return 0
+
+
+if __name__ == "__main__":
+    # python retriever.py  → index events added before chunking existed
+    print(f"[retriever] Backfilled {backfill_chunks()} events")
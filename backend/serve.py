@@ -0,0 +1,251 @@
+import os
+import sys
+import gc
+import json
+import time
+import signal
+import argparse
+import subprocess
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from gunicorn.app.base import BaseApplication
+
+# ────────────────────────────────────────────────
+# PRODUCTION LAUNCHER
+# ────────────────────────────────────────────────
+# `uvicorn main:app --workers N` spawns fresh interpreters, so every
+# worker loads its own copy of the BGE model and the torch runtime.
+# Here the app (and with it the model) is imported once in the gunicorn
+# master and the workers are forked from it, sharing the weights
+# copy-on-write.
+#
+# Run with:
+#   python serve.py --workers 4
+#   python serve.py --report 1,2,4      (RSS / throughput per worker count)
+
+DEFAULT_HOST = os.getenv("HOST", "0.0.0.0")
+DEFAULT_PORT = int(os.getenv("PORT", "8000"))
+DEFAULT_WORKERS = int(os.getenv("WEB_CONCURRENCY", "2"))
+
+
+def torch_threads_per_worker(workers: int) -> int:
+    """Split the cores evenly so N workers don't oversubscribe them."""
+    cores = os.cpu_count() or 1
+    return max(1, cores // max(1, workers))
+
+
+def _limit_native_threads(threads: int):
+    # Must be set before torch / numpy spin up their thread pools
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+
+def _preload_app():
+    import main
+    import frontend
+    import retriever as retriever_module
+
+    # frontend.py keeps its own lazily loaded model; point it at the
+    # shared one so ingestion doesn't load a second copy per worker
+    frontend._MODEL = retriever_module.get_model()
+
+    # Move everything allocated so far out of the GC's reach: collections
+    # would otherwise touch (and so copy) the shared pages in every worker
+    gc.collect()
+    gc.freeze()
+    return main.app
+
+
+# ────────────────────────────────────────────────
+# GUNICORN APP
+# ────────────────────────────────────────────────
+class ChatbotServer(BaseApplication):
+    def __init__(self, host: str, port: int, workers: int):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.threads = torch_threads_per_worker(workers)
+        super().__init__()
+
+    def load_config(self):
+        self.cfg.set("bind", f"{self.host}:{self.port}")
+        self.cfg.set("workers", self.workers)
+        self.cfg.set("worker_class", "uvicorn.workers.UvicornWorker")
+        self.cfg.set("preload_app", True)
+        self.cfg.set("timeout", 120)
+        self.cfg.set("post_fork", self._post_fork)
+
+    def _post_fork(self, server, worker):
+        import torch
+        from database import engine
+
+        torch.set_num_threads(self.threads)
+
+        # Connections opened by the master during startup must not be
+        # shared across processes; drop them without closing the sockets
+        engine.dispose(close=False)
+        print(f"[serve] worker {worker.pid}: torch threads = {self.threads}")
+
+    def load(self):
+        _limit_native_threads(self.threads)
+        return _preload_app()
+
+
+# ────────────────────────────────────────────────
+# REPORT: RSS PER WORKER / THROUGHPUT
+# ────────────────────────────────────────────────
+def _children(pid: int):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def _memory_kb(pid: int):
+    """
+    RSS counts shared pages in full for every worker, PSS splits them
+    between the processes sharing them – the two together show how much
+    of the model is actually shared.
+    """
+    stats = {"rss_kb": None, "pss_kb": None}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, value = line.split(":", 1)
+                if key == "Rss":
+                    stats["rss_kb"] = int(value.split()[0])
+                elif key == "Pss":
+                    stats["pss_kb"] = int(value.split()[0])
+    except OSError:
+        pass
+    return stats
+
+
+def _wait_until_ready(url: str, timeout: float):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=2)
+            return True
+        except Exception:
+            time.sleep(1)
+    return False
+
+
+def _post_chat(url: str, query: str):
+    """HTTP status of one chat request, or None if it never got one."""
+    req = urllib.request.Request(
+        url,
+        data=json.dumps({"query": query}).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=120) as resp:
+            resp.read()
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except Exception:
+        return None
+
+
+def _report_env(requests_per_run: int, concurrency: int):
+    """
+    Every report request comes from 127.0.0.1, so the default chat bucket
+    (burst 10) would turn most of the run into 429s. The child server gets
+    limits sized to the run and in-process buckets, and does not log the
+    queries for FAQ mining.
+    """
+    env = dict(os.environ)
+    env.update({
+        "CHAT_RATE_PER_MINUTE": str(60 * (requests_per_run + 1)),
+        "CHAT_BURST": str(requests_per_run + 1),  # + warm-up request
+        "CHAT_MAX_IN_FLIGHT": str(concurrency),
+        "ADMISSION_REDIS_URL": "",
+        "QUERY_LOG": "0",  # keep load-test queries out of FAQ mining
+    })
+    return env
+
+
+def report(worker_counts, port: int, requests_per_run: int, concurrency: int, query: str):
+    results = []
+
+    for workers in worker_counts:
+        proc = subprocess.Popen(
+            [sys.executable, __file__, "--workers", str(workers),
+             "--host", "127.0.0.1", "--port", str(port)],
+            env=_report_env(requests_per_run, concurrency),
+        )
+        try:
+            if not _wait_until_ready(f"http://127.0.0.1:{port}/", timeout=300):
+                print(f"[serve] {workers} worker(s): server did not come up")
+                continue
+
+            chat_url = f"http://127.0.0.1:{port}/api/chat"
+            _post_chat(chat_url, query)  # warm up
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                statuses = Counter(pool.map(
+                    lambda _: _post_chat(chat_url, query),
+                    range(requests_per_run),
+                ))
+            elapsed = time.perf_counter() - start
+            ok = statuses[200]
+
+            pids = _children(proc.pid)
+            memory = {pid: _memory_kb(pid) for pid in pids}
+            master = _memory_kb(proc.pid)
+
+            row = {
+                "workers": workers,
+                "torch_threads": torch_threads_per_worker(workers),
+                "requests": requests_per_run,
+                "succeeded": ok,
+                # Rejections are counted apart so they never pass for throughput
+                "rejected_429": statuses[429],
+                "rejected_503": statuses[503],
+                "failed": requests_per_run - ok - statuses[429] - statuses[503],
+                "seconds": round(elapsed, 2),
+                "throughput_rps": round(ok / elapsed, 2) if elapsed else None,
+                "master": master,
+                "per_worker": memory,
+                "total_rss_kb": sum(m["rss_kb"] or 0 for m in memory.values()),
+                "total_pss_kb": sum(m["pss_kb"] or 0 for m in memory.values()),
+            }
+            results.append(row)
+            print(json.dumps(row))
+
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(timeout=60)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the chatbot API with pre-forked workers")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--report", help="comma separated worker counts, e.g. 1,2,4")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--query", default="Tell me about the robotics workshop")
+    args = parser.parse_args()
+
+    if args.report:
+        counts = [int(n) for n in args.report.split(",") if n.strip()]
+        report(counts, args.port, args.requests, args.concurrency, args.query)
+        return
+
+    ChatbotServer(args.host, args.port, args.workers).run()
+
+
+if __name__ == "__main__":
+    main()
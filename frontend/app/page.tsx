@@ -8,6 +8,7 @@ export default function ChatPage() {
   const [query, setQuery] = useState("");
   const [answer, setAnswer] = useState("");
   const [loading, setLoading] = useState(false);
+  const [sessionId, setSessionId] = useState<string | null>(null);
 
   const handleSearch = async (e: FormEvent) => {
     e.preventDefault();
@@ -20,9 +21,10 @@ export default function ChatPage() {
       // Hardcoded URL to rule out env var issues
       const res = await axios.post(
         `http://localhost:8000/api/chat`,
-        { query }
+        { query, session_id: sessionId }
       );
       setAnswer(res.data.answer);
+      setSessionId(res.data.session_id ?? null);
     } catch (error: any) {
       console.error(error);
       // Show the actual error message on screen